@@ -1,7 +1,6 @@
 import streamlit as st
-from binance.client import Client
-import pandas as pd
-import time
+from bot_core import BotThread, get_client, get_feed, OPEN_TIME, OPEN, HIGH, LOW, CLOSE, SHORT_AVG, MEDIUM_AVG, LONG_AVG
+import queue
 import plotly.graph_objects as go
 
 # Page Configuration
@@ -21,156 +20,128 @@ stop_loss = st.sidebar.slider("Stop Loss (%)", min_value=0.5, max_value=10.0, va
 # Initialize State
 if "bot_running" not in st.session_state:
     st.session_state["bot_running"] = False
-if "active_trade" not in st.session_state:
-    st.session_state["active_trade"] = None
 
-# Dynamic Display Placeholders
-price_display = st.empty()
-signal_display = st.empty()
-log_display = st.empty()
-chart_display = st.empty()
-
-# Initialize Binance Client
-client = Client(api_key, api_secret) if api_key and api_secret else None
 # Initialize Binance Client
-if "client" not in st.session_state:
+client = None
+if api_key and api_secret:
     try:
-        api_key = "your_api_key"
-        api_secret = "your_api_secret"
-        st.session_state.client = Client(api_key, api_secret)
-        st.session_state.client.ping()  # Test connectivity
-        st.success("Connected to Binance API successfully!")
+        client = get_client(api_key, api_secret)
     except Exception as e:
         st.error(f"Failed to connect to Binance API: {e}")
         st.stop()  # Stop execution if initialization fails
 
-
-# Helper Functions
-def get_live_data(symbol):
-    """Fetch live data for the specified trading pair."""
-    try:
-        klines = client.get_klines(symbol=symbol, interval=Client.KLINE_INTERVAL_1MINUTE, limit=50)
-        df = pd.DataFrame(klines, columns=[
-            "open_time", "open", "high", "low", "close", "volume",
-            "close_time", "quote_asset_volume", "num_trades",
-            "taker_buy_base", "taker_buy_quote", "ignore"
-        ])
-        df["open_time"] = pd.to_datetime(df["open_time"], unit="ms")
-        df.set_index("open_time", inplace=True)
-        df[["open", "high", "low", "close"]] = df[["open", "high", "low", "close"]].astype(float)
-        return df
-    except Exception as e:
-        return None
-
-def calculate_averages(df):
-    """Add short, medium, and long moving averages to the DataFrame."""
-    df["short_avg"] = df["close"].rolling(window=5).mean()
-    df["medium_avg"] = df["close"].rolling(window=20).mean()
-    df["long_avg"] = df["close"].rolling(window=50).mean()
-    return df
-
-def determine_trade_action(df):
-    """Determine trade action based on moving averages."""
-    if len(df) < 50:  # Ensure enough data for long average
-        return "Hold", None, None, None
-
-    short_avg = df["short_avg"].iloc[-1]
-    medium_avg = df["medium_avg"].iloc[-1]
-    long_avg = df["long_avg"].iloc[-1]
-    current_price = df["close"].iloc[-1]
-
-    if medium_avg < long_avg and short_avg < medium_avg and current_price < short_avg:
-        return "Buy", short_avg, medium_avg, long_avg
-    return "Hold", short_avg, medium_avg, long_avg
-
-# Main Bot Logic (Simplified Without `st.experimental_rerun`)
-def run_bot():
-    """Run the trading bot."""
-    if not client:
-        st.warning("Please configure your Binance API keys.")
-        return
-
-    logs = []
-    while st.session_state["bot_running"]:
-        # Fetch live data
-        df = get_live_data(trading_pair)
-        if df is None:
-            logs.append("Error fetching live data.")
-            st.warning("Error fetching live data.")
+# Display Helpers
+REFRESH_INTERVAL = 1  # Seconds between live metric refreshes while a bot is running
+
+
+def build_figure():
+    """Create the empty candlestick chart with its moving average traces."""
+    fig = go.Figure()
+    fig.add_trace(go.Candlestick(name="Price"))
+    fig.add_trace(go.Scatter(mode="lines", name="Short EMA (5)"))
+    fig.add_trace(go.Scatter(mode="lines", name="Medium EMA (20)"))
+    fig.add_trace(go.Scatter(mode="lines", name="Long EMA (50)"))
+    fig.update_layout(uirevision="keep")  # Preserve zoom/pan across updates
+    return fig
+
+def drain_updates():
+    """Keep the newest update the bot has published; returns True if the bot has stopped on its own."""
+    bot = st.session_state.get("bot")
+    if bot is None:
+        return False
+    bot.heartbeat()
+    alive = bot.is_alive()  # Checked first so a dead bot's final updates are already queued
+    while True:
+        try:
+            st.session_state["last_update"] = bot.updates.get_nowait()
+        except queue.Empty:
             break
+    if alive and "error" not in st.session_state.get("last_update", {}):
+        return False
 
-        df = calculate_averages(df)
-        current_price = df["close"].iloc[-1]
-
-        # Determine trade action
-        action, short_avg, medium_avg, long_avg = determine_trade_action(df)
-
-        # Update UI elements
-        price_display.markdown(f"""
-        ### Live Metrics
-        - **Current Price:** ${current_price:.8f}
-        - **Short EMA (5):** {f"${short_avg:.8f}" if short_avg else "N/A"}
-        - **Medium EMA (20):** {f"${medium_avg:.8f}" if medium_avg else "N/A"}
-        - **Long EMA (50):** {f"${long_avg:.8f}" if long_avg else "N/A"}
-        """)
-        signal_display.markdown(f"### Current Signal: **{action}**")
-
-        # Trade Logic
-        if action == "Buy" and not st.session_state["active_trade"]:
-            st.session_state["active_trade"] = {
-                "entry_price": current_price,
-                "target_price": current_price * (1 + profit_target / 100),
-                "stop_price": current_price * (1 - stop_loss / 100),
-            }
-            logs.append(f"Buy order placed at ${current_price:.8f}")
-
-        # Check Active Trade
-        if st.session_state["active_trade"]:
-            trade = st.session_state["active_trade"]
-            if current_price >= trade["target_price"]:
-                logs.append(f"Profit target hit! Sold at ${current_price:.8f}")
-                st.session_state["active_trade"] = None
-            elif current_price <= trade["stop_price"]:
-                logs.append(f"Stop loss triggered! Sold at ${current_price:.8f}")
-                st.session_state["active_trade"] = None
-
-        # Initialize the iteration count in session state
-        if "iteration" not in st.session_state:
-            st.session_state["iteration"] = 0
-
-        # Update Chart Logic
-        fig = go.Figure()
-        fig.add_trace(go.Candlestick(
-            x=df.index,
-            open=df["open"],
-            high=df["high"],
-            low=df["low"],
-            close=df["close"],
-            name="Price"
-        ))
-        fig.add_trace(go.Scatter(x=df.index, y=df["short_avg"], mode="lines", name="Short EMA (5)"))
-        fig.add_trace(go.Scatter(x=df.index, y=df["medium_avg"], mode="lines", name="Medium EMA (20)"))
-        fig.add_trace(go.Scatter(x=df.index, y=df["long_avg"], mode="lines", name="Long EMA (50)"))
-
-        # Increment the persistent iteration count
-        st.session_state["iteration"] += 1
-
-        # Use the updated iteration count as a unique key
-        chart_display.plotly_chart(fig, key=f"chart_update_{st.session_state['iteration']}")
-
-        # Log Display
-        log_display.text("\n".join(logs[-10:]))
-
-        # Sleep to avoid excessive updates
-        time.sleep(5)
+    # The bot halts after publishing an error, and a dead thread publishes nothing more
+    st.session_state.pop("bot").stop()
+    st.session_state["bot_running"] = False
+    if "error" not in st.session_state.get("last_update", {}):
+        st.session_state["last_update"] = {"error": "Bot stopped unexpectedly."}
+    return True
+
+def refresh_figure(update):
+    """Return the persisted figure, copying the candles into it only when a new candle has opened."""
+    fig = st.session_state.get("fig")
+    if fig is None:
+        fig = build_figure()
+        st.session_state["fig"] = fig
+    candle_time = update["candle_time"]
+    if st.session_state.get("last_candle_time") == candle_time:
+        return fig
+    data = update["feed"].latest_data()  # Copy the ring out only when the chart needs it
+    if data is not None:
+        times = data[:, OPEN_TIME].astype("datetime64[ms]")
+        with fig.batch_update():
+            fig.data[0].update(x=times, open=data[:, OPEN], high=data[:, HIGH], low=data[:, LOW], close=data[:, CLOSE])
+            fig.data[1].update(x=times, y=data[:, SHORT_AVG])
+            fig.data[2].update(x=times, y=data[:, MEDIUM_AVG])
+            fig.data[3].update(x=times, y=data[:, LONG_AVG])
+    # Record the candle even without data (the feed closed), or live_metrics would rerun forever
+    st.session_state["last_candle_time"] = candle_time
+    return fig
+
+def render_metrics(update):
+    """Draw the price, moving averages, signal and log for the latest bot update."""
+    short_avg, medium_avg, long_avg = update["short_avg"], update["medium_avg"], update["long_avg"]
+    st.markdown(f"""
+    ### Live Metrics
+    - **Current Price:** ${update["price"]:.8f}
+    - **Short EMA (5):** {f"${short_avg:.8f}" if short_avg else "N/A"}
+    - **Medium EMA (20):** {f"${medium_avg:.8f}" if medium_avg else "N/A"}
+    - **Long EMA (50):** {f"${long_avg:.8f}" if long_avg else "N/A"}
+    """)
+    st.markdown(f"### Current Signal: **{update['action']}**")
+    st.text(update["logs"])
 
 # Start/Stop Bot Buttons
 if st.sidebar.button("Start Bot"):
-    if not st.session_state["bot_running"]:
+    if not client:
+        st.warning("Please configure your Binance API keys.")
+    elif not st.session_state["bot_running"]:
+        feed = get_feed(trading_pair, client)
+        st.session_state["bot"] = BotThread(feed, profit_target, stop_loss)
+        st.session_state["bot"].start()
+        st.session_state.pop("last_candle_time", None)  # Redraw the chart for the new feed
+        st.session_state.pop("last_update", None)  # Don't let a previous bot's error stop this one
         st.session_state["bot_running"] = True
-        run_bot()
 
 if st.sidebar.button("Stop Bot"):
+    bot = st.session_state.pop("bot", None)
+    if bot:
+        bot.stop()
     st.session_state["bot_running"] = False
     st.warning("Bot stopped!")
 
+# Chart: refreshed from the bot's newest update on full reruns only
+drain_updates()
+update = st.session_state.get("last_update")
+fig = refresh_figure(update) if update and "error" not in update else None
+
+# Live Updates: the metrics refresh on their own every second; the chart only
+# goes out with a full rerun, which the fragment triggers once per new candle
+@st.fragment(run_every=REFRESH_INTERVAL if st.session_state["bot_running"] else None)
+def live_metrics():
+    """Redraw the metrics, signal and log; rerun the whole app when a new candle needs charting."""
+    if drain_updates():
+        st.rerun()  # Stop the refresh timer and update the controls
+    update = st.session_state.get("last_update")
+    if update is None:
+        return
+    if "error" in update:
+        st.warning(update["error"])
+        return
+    render_metrics(update)
+    bot = st.session_state.get("bot")
+    if bot is not None and bot.is_alive() and update["candle_time"] != st.session_state.get("last_candle_time"):
+        st.rerun()
+
+live_metrics()
+if fig is not None:
+    st.plotly_chart(fig, key="price_chart")
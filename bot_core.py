@@ -0,0 +1,508 @@
+"""Binance client, shared kline feeds and trading logic used by the Streamlit UI."""
+import streamlit as st
+from binance.client import Client
+from binance.exceptions import BinanceAPIException
+from binance import ThreadedWebsocketManager
+from collections import deque
+from numba import njit
+import functools
+import itertools
+import json
+import orjson
+import requests.models
+import types
+import weakref
+from requests.adapters import HTTPAdapter
+import numpy as np
+import queue
+import threading
+import time
+
+# JSON Decoding
+def fast_json_loads(s, **kwargs):
+    """Drop-in for json.loads backed by orjson; requests passes no options we rely on."""
+    return orjson.loads(s)
+
+# Decode every REST response with orjson; request bodies keep the stdlib encoder
+requests.models.complexjson = types.SimpleNamespace(loads=fast_json_loads, dumps=json.dumps)
+
+# Request Throttling
+WEIGHT_LIMIT = 1200  # Binance request weight allowed per minute
+WEIGHT_REFILL_RATE = WEIGHT_LIMIT / 60  # Weight restored per second
+REQUEST_WEIGHTS = {"ping": 1, "get_klines": 1, "get_server_time": 1}  # Client methods to throttle and their weight
+RATE_LIMIT_CODE = -1003
+MAX_RETRIES = 5
+BACKOFF_BASE = 1  # Seconds before the first retry after a rate-limit error
+
+
+class Throttler:
+    """Token bucket that keeps the request weight under Binance's per-minute limit."""
+
+    def __init__(self, capacity=WEIGHT_LIMIT, refill_rate=WEIGHT_REFILL_RATE):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, weight):
+        """Block until `weight` tokens are available, then take them."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_rate)
+                self.updated = now
+                if self.tokens >= weight:
+                    self.tokens -= weight
+                    return
+                wait = (weight - self.tokens) / self.refill_rate
+            time.sleep(wait)
+
+def throttle(throttler, weight, func):
+    """Wrap a client method so it draws from the throttler and backs off on rate-limit errors."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        for attempt in range(MAX_RETRIES):
+            throttler.acquire(weight)
+            try:
+                return func(*args, **kwargs)
+            except BinanceAPIException as e:
+                if e.code != RATE_LIMIT_CODE or attempt == MAX_RETRIES - 1:
+                    raise
+                time.sleep(BACKOFF_BASE * 2 ** attempt)
+    return wrapper
+
+@st.cache_resource
+def get_throttler():
+    """Share one throttler across clients; Binance enforces the limit per IP."""
+    return Throttler()
+
+
+# Initialize Binance Client
+KEEP_WARM_INTERVAL = 60  # Seconds between keep-alive pings
+MAX_CACHED_CLIENTS = 4  # Key pairs kept warm at once; older entries are evicted
+
+
+def keep_warm(client_ref, stopped):
+    """Ping the API periodically so the pooled connection never goes cold.
+
+    Holds only a weak reference, so the thread ends once the client is evicted from the cache
+    and nothing else (e.g. a running feed) still uses it.
+    """
+    while not stopped.wait(KEEP_WARM_INTERVAL):
+        client = client_ref()
+        if client is None:
+            return
+        try:
+            client.ping()
+        except Exception:
+            pass
+        del client
+
+@st.cache_resource(max_entries=MAX_CACHED_CLIENTS)
+def get_client(key, secret):
+    """Create the Binance client once per API key pair and reuse it across reruns."""
+    client = Client(key, secret)
+    throttler = get_throttler()
+    for name, weight in REQUEST_WEIGHTS.items():
+        setattr(client, name, throttle(throttler, weight, getattr(client, name)))
+    # Keep pooled connections alive so REST calls skip the TCP/TLS handshake
+    client.session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16, pool_block=False))
+    client.session.headers["Connection"] = "keep-alive"
+    client.ping()  # Test connectivity
+    # Sign requests against server time so they are not rejected with -1021
+    server_time = client.get_server_time()["serverTime"]
+    client.timestamp_offset = server_time - int(time.time() * 1000)
+    stopped = threading.Event()
+    weakref.finalize(client, stopped.set)  # Stop pinging as soon as the cached client is released
+    threading.Thread(target=keep_warm, args=(weakref.ref(client), stopped), daemon=True).start()
+    return client
+
+
+# Helper Functions
+KLINE_COLUMNS = ["open_time", "open", "high", "low", "close", "volume", "short_avg", "medium_avg", "long_avg"]
+OPEN_TIME, OPEN, HIGH, LOW, CLOSE, VOLUME, SHORT_AVG, MEDIUM_AVG, LONG_AVG = range(len(KLINE_COLUMNS))
+KLINE_HISTORY = 50
+AVERAGE_WINDOWS = (5, 20, 50)  # Short, medium and long moving average windows
+CANDLE_SECONDS = 60
+UPDATE_QUEUE_SIZE = 10
+LOG_HISTORY = 200  # Log lines kept by each bot
+# Seconds without a UI heartbeat before a bot assumes its session is gone. Browsers throttle timers in
+# hidden tabs to about once a minute, so this allows several missed beats before giving up.
+SESSION_TIMEOUT = 300
+TRADE_ACTIONS = ("Buy", "Hold", "Hold", "Hold")  # Indexed by the trend score
+EXIT_NONE, EXIT_PROFIT, EXIT_STOP = range(3)
+
+
+class RollingMean:
+    """Mean of the last `window` values, kept up to date with a running sum."""
+
+    def __init__(self, window):
+        self.window = window
+        self.values = deque(maxlen=window)
+        self.total = 0.0
+
+    def push(self, value):
+        """Add a new value, evicting the oldest once the window is full."""
+        if len(self.values) == self.window:
+            self.total -= self.values[0]
+        self.values.append(value)
+        self.total += value
+
+    def reset(self, values):
+        """Start over from the tail of `values`, e.g. after a bulk backfill."""
+        self.values = deque(values[-self.window:], maxlen=self.window)
+        self.total = float(sum(self.values))
+
+    def replace_last(self, value):
+        """Overwrite the newest value, e.g. when the current candle's close moves."""
+        self.total += value - self.values[-1]
+        self.values[-1] = value
+
+    @property
+    def mean(self):
+        return self.total / self.window if len(self.values) == self.window else float("nan")
+
+class KlineRing:
+    """Preallocated float64 ring buffer of kline rows laid out as KLINE_COLUMNS.
+
+    Rows are written in place, so the hot path never allocates; `ordered` builds an
+    oldest-first copy only when something needs the whole history. Writes and the
+    copying reads share a lock so readers never see a half-updated ring.
+    """
+
+    def __init__(self, size):
+        self.rows = np.empty((size, len(KLINE_COLUMNS)), dtype=np.float64)
+        self.count = 0  # Rows ever written; the newest lives at (count - 1) % size
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return min(self.count, len(self.rows))
+
+    def fill(self, rows):
+        """Replace the contents with `rows`, oldest first."""
+        rows = rows[-len(self.rows):]
+        with self.lock:
+            self.rows[:len(rows)] = rows
+            self.count = len(rows)
+
+    def append(self, row):
+        with self.lock:
+            self.rows[self.count % len(self.rows)] = row
+            self.count += 1
+
+    def replace_last(self, row):
+        with self.lock:
+            self.rows[(self.count - 1) % len(self.rows)] = row
+
+    def latest(self):
+        """Return a live view of the newest row; only safe on the writing thread."""
+        return self.rows[(self.count - 1) % len(self.rows)]
+
+    def snapshot(self):
+        """Return a copy of the newest row and the number of buffered rows, taken atomically."""
+        with self.lock:
+            return self.rows[(self.count - 1) % len(self.rows)].copy(), min(self.count, len(self.rows))
+
+    def ordered(self):
+        """Return a copy of the buffered rows, oldest first."""
+        with self.lock:
+            if self.count < len(self.rows):
+                return self.rows[:self.count].copy()
+            return np.roll(self.rows, -(self.count % len(self.rows)), axis=0)
+
+def simple_moving_average(closes, window):
+    """Return the SMA of every position in `closes` from a single cumsum, NaN until the window fills."""
+    cs = np.concatenate(([0.0], np.cumsum(closes)))
+    sma = np.full(len(closes), np.nan)
+    sma[window - 1:] = (cs[window:] - cs[:-window]) / window
+    return sma
+
+def start_kline_stream(client, symbol, on_update=None, on_error=None):
+    """Subscribe to the 1m kline websocket for the symbol and return the manager and its KlineRing.
+
+    Each buffered row carries the short, medium and long averages as of that candle,
+    updated incrementally as closes arrive. `on_update` is called after every websocket kline;
+    `on_error` is called with the message when the stream reports an error (e.g. reconnects ran out).
+    If candles were missed, the ring is re-seeded over REST so the windows never span a gap.
+    """
+    ring = KlineRing(KLINE_HISTORY)
+    averages = [RollingMean(window) for window in AVERAGE_WINDOWS]
+
+    def add_kline(open_time, o, h, l, c, v):
+        if len(ring) and ring.latest()[OPEN_TIME] == open_time:
+            # Still the same candle, overwrite in place
+            for avg in averages:
+                avg.replace_last(c)
+            ring.replace_last((open_time, o, h, l, c, v, *(avg.mean for avg in averages)))
+        else:
+            for avg in averages:
+                avg.push(c)
+            ring.append((open_time, o, h, l, c, v, *(avg.mean for avg in averages)))
+
+    def seed():
+        klines = client.get_klines(symbol=symbol, interval=Client.KLINE_INTERVAL_1MINUTE, limit=KLINE_HISTORY)
+        rows = np.array([k[:6] for k in klines], dtype=np.float64).reshape(-1, 6)
+        closes = rows[:, CLOSE]
+        smas = [simple_moving_average(closes, window) for window in AVERAGE_WINDOWS]
+        ring.fill(np.column_stack([rows, *smas]))
+        for avg in averages:
+            avg.reset(closes.tolist())
+
+    # Seed the ring once over REST; the websocket keeps it current afterwards
+    seed()
+
+    def on_msg(msg):
+        if msg.get("e") == "error":
+            if on_error:
+                on_error(msg.get("m", "Kline stream failed"))
+            return
+        if msg.get("e") != "kline":
+            return
+        k = msg["k"]
+        if len(ring) and k["t"] - ring.latest()[OPEN_TIME] > CANDLE_SECONDS * 1000:
+            # Candles were missed (e.g. across a reconnect); backfill instead of bridging the gap
+            try:
+                seed()
+            except Exception as e:
+                if on_error:
+                    on_error(f"Failed to backfill missed candles: {e}")
+                return
+        add_kline(k["t"], float(k["o"]), float(k["h"]), float(k["l"]), float(k["c"]), float(k["v"]))
+        if on_update:
+            on_update()
+
+    twm = ThreadedWebsocketManager()
+    twm.start()
+    twm.start_kline_socket(callback=on_msg, symbol=symbol, interval=Client.KLINE_INTERVAL_1MINUTE)
+    return twm, ring
+
+class SymbolFeed:
+    """Kline stream for one symbol, shared by every session trading it and closed when the last one leaves.
+
+    Each BotThread holds one subscription for as long as it runs and releases it when it exits,
+    whether it was stopped, halted on an error or outlived its session.
+    """
+
+    def __init__(self, client, symbol):
+        self.client = client
+        self.symbol = symbol
+        self.subscribers = 0
+        self.twm = None
+        self.ring = None
+        self.version = 0  # Bumped on every websocket kline
+        self.error = None  # Set once the stream reports it has failed
+        self.lock = threading.Lock()
+        self.updated = threading.Condition()
+
+    def subscribe(self):
+        """Register a reader, opening the stream for the first one or replacing it if it has failed."""
+        with self.lock:
+            if self.subscribers == 0 or self.error or self.twm is None:
+                # Bots still on a failed stream unsubscribe asynchronously; don't make newcomers join it
+                if self.twm:
+                    self.twm.stop()
+                    self.twm, self.ring = None, None
+                self.error = None
+                self.twm, self.ring = start_kline_stream(
+                    self.client, self.symbol, on_update=self._on_update, on_error=self._on_error
+                )
+            self.subscribers += 1
+
+    def unsubscribe(self):
+        """Drop a reader, closing the stream once nobody is left."""
+        with self.lock:
+            if self.subscribers == 0:
+                return
+            self.subscribers -= 1
+            if self.subscribers == 0 and self.twm:
+                self.twm.stop()
+                self.twm, self.ring = None, None
+
+    def _on_update(self):
+        with self.updated:
+            self.version += 1
+            self.updated.notify_all()
+
+    def _on_error(self, message):
+        with self.updated:
+            self.error = message
+            self.version += 1
+            self.updated.notify_all()
+
+    def wait_for_update(self, version, timeout, cancelled):
+        """Block until a kline newer than `version` arrives, `cancelled()` is true or the timeout passes.
+
+        Returns the latest version so the caller can wait for the next one.
+        """
+        with self.updated:
+            self.updated.wait_for(lambda: self.version != version or cancelled(), timeout)
+            return self.version
+
+    def wake(self):
+        """Wake every waiting reader so it can re-check whether it was cancelled."""
+        with self.updated:
+            self.updated.notify_all()
+
+    def latest_row(self):
+        """Return a copy of the newest kline row and how many rows are buffered, or (None, 0) without data."""
+        ring = self.ring
+        if ring is None or not len(ring):
+            return None, 0
+        return ring.snapshot()
+
+    def latest_data(self):
+        """Return an oldest-first copy of the buffered klines, or None if the stream has no data."""
+        ring = self.ring
+        if ring is None or not len(ring):
+            return None
+        return ring.ordered()
+
+@st.cache_resource
+def get_feed(symbol, _client):
+    """Return the process-wide feed for a symbol so N sessions cost one stream, not N."""
+    return SymbolFeed(_client, symbol)
+
+@njit(cache=True)
+def decide(latest, in_trade, target_price, stop_price):
+    """Score the latest kline row and check an open trade's exits; returns (score, EXIT_* code)."""
+    current_price = latest[CLOSE]
+    short_avg = latest[SHORT_AVG]
+    medium_avg = latest[MEDIUM_AVG]
+    long_avg = latest[LONG_AVG]
+
+    # Count the averages that are not in descending order; Buy only when none are
+    # int() matters: NumPy adds np.bool_ values as a logical OR, not a count
+    score = int(medium_avg >= long_avg) + int(short_avg >= medium_avg) + int(current_price >= short_avg)
+
+    exit_code = EXIT_NONE
+    if in_trade:
+        if current_price >= target_price:
+            exit_code = EXIT_PROFIT
+        elif current_price <= stop_price:
+            exit_code = EXIT_STOP
+    return score, exit_code
+
+def determine_trade_action(latest, history, trade):
+    """Determine trade action based on moving averages, and whether an open trade hit its target or stop."""
+    in_trade = trade is not None
+    target_price, stop_price = (trade["target_price"], trade["stop_price"]) if in_trade else (0.0, 0.0)
+    score, exit_code = decide(latest, in_trade, target_price, stop_price)
+
+    if history < 50:  # Ensure enough data for long average
+        return "Hold", exit_code, None, None, None
+
+    short_avg, medium_avg, long_avg = latest[SHORT_AVG:LONG_AVG + 1]
+    return TRADE_ACTIONS[score], exit_code, short_avg, medium_avg, long_avg
+
+# Main Bot Logic
+class BotThread(threading.Thread):
+    """Run the trading loop off the Streamlit script thread and publish updates to a queue."""
+
+    def __init__(self, feed, profit_target, stop_loss):
+        super().__init__(daemon=True)
+        self.feed = feed
+        self.profit_target = profit_target
+        self.stop_loss = stop_loss
+        self.updates = queue.Queue(maxsize=UPDATE_QUEUE_SIZE)
+        self.active_trade = None
+        self.logs = deque(maxlen=LOG_HISTORY)
+        self._stop_event = threading.Event()
+        self._last_heartbeat = time.monotonic()
+
+    def heartbeat(self):
+        """Called on every script run so the bot knows its session is still open."""
+        self._last_heartbeat = time.monotonic()
+
+    def session_expired(self):
+        """True once the UI has stopped refreshing, e.g. the tab was closed or reloaded."""
+        return time.monotonic() - self._last_heartbeat > SESSION_TIMEOUT
+
+    def stop(self):
+        """Ask the bot to exit; it wakes immediately instead of waiting for the next kline."""
+        self._stop_event.set()
+        self.feed.wake()
+
+    def publish(self, update):
+        """Queue an update for the UI, dropping the oldest one if the UI has fallen behind."""
+        try:
+            self.updates.put_nowait(update)
+        except queue.Full:
+            try:
+                self.updates.get_nowait()
+            except queue.Empty:
+                pass
+            self.updates.put_nowait(update)
+
+    def run(self):
+        try:
+            self.feed.subscribe()
+        except Exception as e:
+            self.publish({"error": f"Error fetching live data: {e}"})
+            return
+
+        try:
+            version = self.feed.version
+            while not self._stop_event.is_set():
+                if self.session_expired():
+                    self.publish({"error": "Bot stopped: the page stopped refreshing."})
+                    break
+                try:
+                    self.step()
+                except Exception as e:
+                    self.publish({"error": f"Bot stopped after an error: {e}"})
+                    break
+                # Sleep until the stream pushes a kline; fall back to the next candle boundary if it goes quiet,
+                # but never past the session timeout so an abandoned bot still releases its feed subscription
+                timeout = min(CANDLE_SECONDS - time.time() % CANDLE_SECONDS, SESSION_TIMEOUT)
+                version = self.feed.wait_for_update(version, timeout, self._stop_event.is_set)
+        finally:
+            self.feed.unsubscribe()
+
+    def step(self):
+        """Run a single iteration of the trading logic."""
+        if self.feed.error:
+            # A dead stream must not look like a quiet market; stop trading on stale prices
+            self.publish({"error": f"Error fetching live data: {self.feed.error}"})
+            self._stop_event.set()
+            return
+
+        latest, history = self.feed.latest_row()
+        if latest is None:
+            self.publish({"error": "Error fetching live data."})
+            return
+
+        candle_time = latest[OPEN_TIME]
+        current_price = latest[CLOSE]
+
+        # Determine trade action
+        action, exit_code, short_avg, medium_avg, long_avg = determine_trade_action(latest, history, self.active_trade)
+
+        # Trade Logic
+        if not self.active_trade:
+            if action == "Buy":
+                self.active_trade = {
+                    "entry_price": current_price,
+                    "target_price": current_price * (1 + self.profit_target / 100),
+                    "stop_price": current_price * (1 - self.stop_loss / 100),
+                }
+                self.logs.append(f"Buy order placed at ${current_price:.8f}")
+
+        # Check Active Trade
+        elif exit_code == EXIT_PROFIT:
+            self.logs.append(f"Profit target hit! Sold at ${current_price:.8f}")
+            self.active_trade = None
+        elif exit_code == EXIT_STOP:
+            self.logs.append(f"Stop loss triggered! Sold at ${current_price:.8f}")
+            self.active_trade = None
+
+        self.publish({
+            "feed": self.feed,
+            "candle_time": candle_time,
+            "price": current_price,
+            "action": action,
+            "short_avg": short_avg,
+            "medium_avg": medium_avg,
+            "long_avg": long_avg,
+            "logs": "\n".join(itertools.islice(self.logs, max(0, len(self.logs) - 10), None)),
+        })